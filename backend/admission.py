@@ -0,0 +1,165 @@
+import time
+import threading
+from collections import deque, Counter
+from contextlib import asynccontextmanager
+
+# --- Admission Control ---
+# Picks a service tier for each /evaluate request from the current load, so
+# throughput degrades gracefully instead of every request timing out.
+#
+#   full       -> all agents at full depth + Gemini narrative
+#   no_llm     -> skip Gemini, use the rule-based narrative
+#   shallow    -> no_llm + agents fetch fewer results / search queries
+#   cache_only -> no_llm + only cached agent results, no upstream calls
+#
+# The tier comes from queue depth and Gemini health only. A data upstream that
+# is unhealthy degrades just the agents calling it (see upstream_mode), and is
+# probed with one live call every PROBE_INTERVAL so it can recover.
+TIERS = ["full", "no_llm", "shallow", "cache_only"]
+
+# Requests already in flight in this process before the tier steps down
+QUEUE_THRESHOLDS = [(16, "cache_only"), (8, "shallow"), (4, "no_llm")]
+
+WINDOW_SECONDS = 300 # Only recent observations count
+MIN_SAMPLES = 5 # Don't judge an upstream on fewer observations than this
+ERROR_RATE_LIMIT = 0.5
+LATENCY_LIMITS = {"gemini": 20.0} # Seconds; data upstreams use DEFAULT_LATENCY_LIMIT
+DEFAULT_LATENCY_LIMIT = 8.0
+DATA_UPSTREAMS = ["clinicaltrials", "pubmed", "duckduckgo"]
+PROBE_INTERVAL = 30 # Seconds between live calls to an upstream that is failing
+UPSTREAM_MODES = ["live", "shallow", "cache_only"]
+
+class Admission:
+    def __init__(self, tier: str, reasons):
+        self.tier = tier
+        self.reasons = reasons
+
+    @property
+    def use_llm(self):
+        return self.tier == "full"
+
+class AdmissionController:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.samples = {} # upstream -> deque of (timestamp, ok, seconds)
+        self.last_probe = {} # upstream -> timestamp of the last half-open probe
+        self.tier_counts = Counter()
+        self.tier_switches = 0
+        self.current_tier = "full"
+
+    def record(self, upstream: str, ok: bool, seconds: float, probe: bool = False):
+        with self.lock:
+            samples = self.samples.setdefault(upstream, deque(maxlen=100))
+            if probe and ok:
+                # The upstream is back: forget the failures still inside the window
+                print(f"Admission: {upstream} probe succeeded, resuming live calls")
+                samples.clear()
+            samples.append((time.time(), ok, seconds))
+
+    def upstream_health(self, upstream: str):
+        cutoff = time.time() - WINDOW_SECONDS
+        with self.lock:
+            recent = [s for s in self.samples.get(upstream, []) if s[0] >= cutoff]
+        if not recent:
+            return {"samples": 0, "error_rate": 0.0, "avg_latency": 0.0}
+        return {
+            "samples": len(recent),
+            "error_rate": round(sum(1 for s in recent if not s[1]) / len(recent), 3),
+            "avg_latency": round(sum(s[2] for s in recent) / len(recent), 3),
+        }
+
+    def _unhealthy(self, upstream: str):
+        """
+        Returns (mode, reason) for an unhealthy upstream, else None. A failing
+        upstream is only worth reading from cache; a slow one is called shallow.
+        """
+        health = self.upstream_health(upstream)
+        if health["samples"] < MIN_SAMPLES:
+            return None
+        if health["error_rate"] > ERROR_RATE_LIMIT:
+            return "cache_only", f"{upstream} error rate {health['error_rate']:.0%}"
+        limit = LATENCY_LIMITS.get(upstream, DEFAULT_LATENCY_LIMIT)
+        if health["avg_latency"] > limit:
+            return "shallow", f"{upstream} avg latency {health['avg_latency']:.1f}s > {limit:.0f}s"
+        return None
+
+    def choose_tier(self, queue_depth: int):
+        """
+        Returns (tier, reasons); the most degraded tier any signal asks for wins.
+        """
+        candidates = [("full", None)]
+
+        for threshold, tier in QUEUE_THRESHOLDS:
+            if queue_depth >= threshold:
+                candidates.append((tier, f"queue depth {queue_depth} >= {threshold}"))
+                break
+
+        llm_problem = self._unhealthy("gemini")
+        if llm_problem:
+            candidates.append(("no_llm", llm_problem[1]))
+
+        tier = max((c[0] for c in candidates), key=TIERS.index)
+        reasons = [reason for t, reason in candidates if reason]
+        return tier, reasons
+
+    def upstream_mode(self, upstream: str, tier: str):
+        """
+        Returns (mode, reason) for the agents calling one data upstream: "live",
+        "shallow" or "cache_only". The request tier sets the baseline; the
+        upstream's own health can only degrade it further. reason is set only
+        when the upstream itself is unhealthy.
+        """
+        mode = tier if tier in ("shallow", "cache_only") else "live"
+        problem = self._unhealthy(upstream)
+        if problem is None:
+            return mode, None
+        upstream_mode, reason = problem
+        if UPSTREAM_MODES.index(upstream_mode) > UPSTREAM_MODES.index(mode):
+            mode = upstream_mode
+        return mode, f"{reason} ({upstream} {mode})"
+
+    def claim_probe(self, upstream: str):
+        """
+        Half-open circuit: True for at most one caller per PROBE_INTERVAL, who
+        may then call the unhealthy upstream live to see if it has recovered.
+        """
+        now = time.time()
+        with self.lock:
+            if now - self.last_probe.get(upstream, 0) < PROBE_INTERVAL:
+                return False
+            self.last_probe[upstream] = now
+            return True
+
+    @asynccontextmanager
+    async def admit(self):
+        with self.lock:
+            queue_depth = self.in_flight
+            self.in_flight += 1
+        try:
+            tier, reasons = self.choose_tier(queue_depth)
+            with self.lock:
+                self.tier_counts[tier] += 1
+                if tier != self.current_tier:
+                    print(f"Admission: tier {self.current_tier} -> {tier} ({'; '.join(reasons) or 'load recovered'})")
+                    self.tier_switches += 1
+                    self.current_tier = tier
+            yield Admission(tier, reasons)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def snapshot(self):
+        upstreams = {u: self.upstream_health(u) for u in DATA_UPSTREAMS + ["gemini"]}
+        for u in DATA_UPSTREAMS:
+            upstreams[u]["mode"] = self.upstream_mode(u, "full")[0]
+        with self.lock:
+            return {
+                "current_tier": self.current_tier,
+                "in_flight": self.in_flight,
+                "tier_switches": self.tier_switches,
+                "requests_by_tier": {tier: self.tier_counts[tier] for tier in TIERS},
+                "upstreams": upstreams,
+            }
+
+admission_controller = AdmissionController()
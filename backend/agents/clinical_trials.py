@@ -1,17 +1,20 @@
 import httpx
 import asyncio
 import random
+from coordination import rate_limit, shared_cache
 
-async def fetch_clinical_trials(query: str):
+@shared_cache("clinical_trials")
+async def fetch_clinical_trials(query: str, shallow: bool = False):
     """
     Fetches real clinical trial data from ClinicalTrials.gov API v2.
     Falls back to mock data if the API is blocked (403).
+    shallow=True fetches fewer studies (used under load, see admission.py).
     """
     url = "https://clinicaltrials.gov/api/v2/studies"
     
     params = {
         "query.term": query,
-        "pageSize": "20", 
+        "pageSize": "5" if shallow else "20", 
         "fields": "NCTId,BriefTitle,OverallStatus,Phase,StartDate,CompletionDate"
     }
 
@@ -22,6 +25,7 @@ async def fetch_clinical_trials(query: str):
 
     try:
         async with httpx.AsyncClient(verify=False) as client: 
+            await rate_limit("clinicaltrials")
             response = await client.get(url, params=params, headers=headers, timeout=10.0)
             
             if response.status_code == 403:
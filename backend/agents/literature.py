@@ -2,14 +2,17 @@ import httpx
 import asyncio
 import xml.etree.ElementTree as ET # For basic XML parsing if needed, though JSON is preferred
 import json
+from coordination import rate_limit, shared_cache
 
 NCBI_API_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
 ESEARCH_URL = NCBI_API_BASE + "esearch.fcgi"
 ESUMMARY_URL = NCBI_API_BASE + "esummary.fcgi"
 
-async def fetch_literature(query: str):
+@shared_cache("literature")
+async def fetch_literature(query: str, shallow: bool = False):
     """
     Fetches real literature data from PubMed using NCBI E-utilities API.
+    shallow=True fetches fewer articles (used under load, see admission.py).
     """
     headers = {
         "User-Agent": "PharmaScout/1.0 (Educational Project; contact@example.com)",
@@ -22,9 +25,10 @@ async def fetch_literature(query: str):
             esearch_params = {
                 "db": "pubmed",
                 "term": query,
-                "retmax": 10, # Get top 10 relevant articles
+                "retmax": 3 if shallow else 10, # Get top 10 relevant articles
                 "retmode": "json"
             }
+            await rate_limit("pubmed")
             esearch_response = await client.get(ESEARCH_URL, params=esearch_params, headers=headers)
             esearch_response.raise_for_status()
             esearch_data = esearch_response.json()
@@ -44,6 +48,7 @@ async def fetch_literature(query: str):
                 "id": ",".join(id_list),
                 "retmode": "json"
             }
+            await rate_limit("pubmed")
             esummary_response = await client.get(ESUMMARY_URL, params=esummary_params, headers=headers)
             esummary_response.raise_for_status()
             esummary_data = esummary_response.json()
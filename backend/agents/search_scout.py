@@ -1,20 +1,73 @@
-from duckduckgo_search import DDGS
+import time
 import asyncio
+from coordination import rate_limit, shared_cache, RateLimitExceeded, MAX_RATE_LIMIT_WAIT
+
+def get_search_client():
+    # duckduckgo_search pulls in lxml and primp, so it is imported on first use
+    from duckduckgo_search import DDGS
+    return DDGS
 
 def perform_search(query: str, max_results=5):
     """
     Scrapes the open web using DuckDuckGo.
+    Returns None (not []) on errors so an outage or ban is not mistaken for
+    a search that genuinely found nothing.
     """
     try:
-        results = DDGS().text(query, max_results=max_results)
+        results = get_search_client()().text(query, max_results=max_results)
         return results if results else []
     except Exception as e:
         print(f"Search Error: {e}")
-        return []
+        return None
+
+async def search_web(query: str, max_results=5, max_wait=MAX_RATE_LIMIT_WAIT):
+    """
+    perform_search behind the DuckDuckGo token bucket shared by all workers.
+    The blocking DDGS call runs in a thread so it never stalls the event loop.
+    """
+    try:
+        await rate_limit("duckduckgo", max_wait=max_wait)
+    except RateLimitExceeded as e:
+        print(f"Search Skipped: {e}")
+        return None
+    return await asyncio.to_thread(perform_search, query, max_results)
+
+async def run_searches(queries, max_results=2):
+    """
+    Runs the queries sequentially (safer for rate limits) with one
+    MAX_RATE_LIMIT_WAIT budget for the whole agent, not one per query.
+    Returns (findings, failed_searches).
+    """
+    deadline = time.monotonic() + MAX_RATE_LIMIT_WAIT
+    findings = []
+    failed_searches = 0
+    for q in queries:
+        results = await search_web(q, max_results=max_results, max_wait=max(0.0, deadline - time.monotonic()))
+        if results is None:
+            failed_searches += 1
+            continue
+        for r in results:
+            findings.append(f"{r['title']}: {r['body']}")
+    return findings, failed_searches
+
+def search_status(failed_searches):
+    # A result missing some searches scores differently, so it must not be cached
+    return "partial" if failed_searches else "completed"
+
+def get_search_failure_data(neutral_score):
+    # Not "completed", so it is neither cached nor counted as a healthy upstream
+    return {
+        "score": neutral_score,
+        "summary": "Web search unavailable (DuckDuckGo error or rate limit).",
+        "findings": ["All web searches failed. Retry later."],
+        "status": "failed"
+    }
 
-async def fetch_market_data(drug_name: str):
+@shared_cache("market")
+async def fetch_market_data(drug_name: str, shallow: bool = False):
     """
     Searches for Market Size, Pricing, and Competitors.
+    shallow=True runs only the first search query (used under load).
     """
     queries = [
         f"{drug_name} market size 2024 2025",
@@ -22,20 +75,20 @@ async def fetch_market_data(drug_name: str):
         f"{drug_name} price cost treatment"
     ]
     
-    findings = []
-    
-    # We run these sequentially or parallel (sequential is safer for rate limits)
-    for q in queries:
-        results = perform_search(q, max_results=2)
-        for r in results:
-            findings.append(f"{r['title']}: {r['body']}")
+    if shallow:
+        queries = queries[:1]
+
+    findings, failed_searches = await run_searches(queries)
+
+    if failed_searches == len(queries):
+        return get_search_failure_data(0)
             
     if not findings:
         return {
             "score": 0,
             "summary": "No market data found in public web search.",
             "findings": ["Web search returned zero results."],
-            "status": "completed"
+            "status": search_status(failed_searches)
         }
         
     # Simple Heuristic Scoring based on keywords in snippets
@@ -54,12 +107,14 @@ async def fetch_market_data(drug_name: str):
         "score": min(95, score),
         "summary": "Market intelligence gathered from open web.",
         "findings": findings[:5], # Top 5 snippets
-        "status": "completed"
+        "status": search_status(failed_searches)
     }
 
-async def fetch_ip_data(drug_name: str):
+@shared_cache("ip")
+async def fetch_ip_data(drug_name: str, shallow: bool = False):
     """
     Searches for Patents and Expiry.
+    shallow=True runs only the first search query (used under load).
     """
     queries = [
         f"{drug_name} patent expiry date",
@@ -67,19 +122,20 @@ async def fetch_ip_data(drug_name: str):
         f"{drug_name} patent litigation lawsuit"
     ]
     
-    findings = []
-    
-    for q in queries:
-        results = perform_search(q, max_results=2)
-        for r in results:
-            findings.append(f"{r['title']}: {r['body']}")
+    if shallow:
+        queries = queries[:1]
+
+    findings, failed_searches = await run_searches(queries)
+
+    if failed_searches == len(queries):
+        return get_search_failure_data(50) # Neutral risk
             
     if not findings:
         return {
             "score": 50, # Neutral risk
             "summary": "No specific patent data found.",
             "findings": ["Web search returned zero results."],
-            "status": "completed"
+            "status": search_status(failed_searches)
         }
 
     # Inverse Scoring: We want LOW risk. 
@@ -102,5 +158,5 @@ async def fetch_ip_data(drug_name: str):
         "score": risk_score,
         "summary": "Patent landscape scanned via web search.",
         "findings": findings[:5],
-        "status": "completed"
+        "status": search_status(failed_searches)
     }
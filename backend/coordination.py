@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import functools
+import contextvars
+
+# --- Coordination Backend ---
+# State that must be shared between uvicorn workers / replicas: upstream rate
+# limits, agent result cache and background job state.
+#
+#   COORDINATION_URL unset          -> in-process memory (single worker, dev default)
+#   COORDINATION_URL=sqlite:///path -> file-backed, shared by all workers on one node
+#   COORDINATION_URL=redis://...    -> Redis-compatible store, shared across replicas
+COORDINATION_URL = os.getenv("COORDINATION_URL", "")
+KEY_PREFIX = "pharma-scout:"
+
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(6 * 3600))) # Seconds
+JOB_STATE_TTL = 24 * 3600 # Seconds
+
+# Token buckets per upstream: (tokens per second, burst capacity)
+UPSTREAM_LIMITS = {
+    "pubmed": (3.0, 3),          # NCBI E-utilities limit without an API key
+    "clinicaltrials": (5.0, 5),
+    "duckduckgo": (0.5, 2),      # DDG bans aggressive scrapers quickly
+}
+MAX_RATE_LIMIT_WAIT = float(os.getenv("MAX_RATE_LIMIT_WAIT", "10")) # Seconds
+
+class RateLimitExceeded(Exception):
+    pass
+
+def _reserve(tokens, updated_at, now, rate, capacity, max_wait):
+    """
+    Refills a bucket and takes one token. Tokens may go negative: the caller
+    has then reserved a future slot and must wait the returned seconds. If
+    that wait would exceed max_wait, nothing is taken and granted is False.
+    Returns (tokens, wait, granted).
+    """
+    if tokens is None:
+        tokens, updated_at = capacity, now
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+    if wait > max_wait:
+        return tokens, wait, False
+    return tokens - 1, wait, True
+
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {} # name -> (tokens, updated_at)
+        self.values = {} # key -> (value, expires_at)
+
+    def reserve_token(self, name, rate, capacity, max_wait):
+        with self.lock:
+            now = time.time()
+            tokens, updated_at = self.buckets.get(name, (None, None))
+            tokens, wait, granted = _reserve(tokens, updated_at, now, rate, capacity, max_wait)
+            self.buckets[name] = (tokens, now)
+            return wait, granted
+
+    def get(self, key):
+        with self.lock:
+            value, expires_at = self.values.get(key, (None, 0))
+            if expires_at < time.time():
+                self.values.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.values[key] = (value, time.time() + ttl)
+
+class SQLiteBackend:
+    """
+    Local stand-in for Redis: every worker process on the node opens the same
+    file, and BEGIN IMMEDIATE serialises the read-modify-write of a bucket.
+    """
+    def __init__(self, path):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def reserve_token(self, name, rate, capacity, max_wait):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            now = time.time()
+            tokens, wait, granted = _reserve(row[0] if row else None, row[1] if row else None, now, rate, capacity, max_wait)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)", (name, tokens, now))
+            conn.execute("COMMIT")
+            return wait, granted
+        finally:
+            conn.close()
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl))
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+        finally:
+            conn.close()
+
+class RedisBackend:
+    # Same algorithm as _reserve, run atomically server-side on the Redis clock
+    # so replicas with skewed clocks still agree.
+    RESERVE_SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local max_wait = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+    local wait = 0
+    if tokens < 1 then wait = (1 - tokens) / rate end
+    local granted = 0
+    if wait <= max_wait then
+        tokens = tokens - 1
+        granted = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil((capacity + max_wait * rate) / rate) + 60)
+    return {tostring(wait), granted}
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("COORDINATION_URL points to Redis but the 'redis' package is not installed.")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.reserve_script = self.client.register_script(self.RESERVE_SCRIPT)
+
+    def reserve_token(self, name, rate, capacity, max_wait):
+        wait, granted = self.reserve_script(keys=[name], args=[rate, capacity, max_wait])
+        return float(wait), bool(granted)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=ttl)
+
+def create_backend(url: str):
+    if not url:
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported COORDINATION_URL: {url}")
+
+_backend = None
+_backend_lock = threading.Lock()
+_local_buckets = MemoryBackend() # Per-process fallback when the shared store is unreachable
+
+# What our own token buckets did to the current agent call: seconds spent
+# waiting, and whether any request was rejected before reaching the upstream.
+# Lets callers tell upstream latency and errors apart from self-imposed ones.
+_rate_limit_usage = contextvars.ContextVar("rate_limit_usage", default=None)
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(COORDINATION_URL)
+    return _backend
+
+# --- Rate Limiting ---
+async def rate_limit(upstream: str, max_wait: float = MAX_RATE_LIMIT_WAIT):
+    """
+    Waits until this process may send one request to `upstream`, counted
+    against the bucket shared by all workers. Raises RateLimitExceeded instead
+    of queueing for longer than max_wait. If the shared store errors, falls
+    back to a per-process bucket rather than failing the request.
+    """
+    rate, capacity = UPSTREAM_LIMITS[upstream]
+    name = KEY_PREFIX + "bucket:" + upstream
+    try:
+        wait, granted = await asyncio.to_thread(get_backend().reserve_token, name, rate, capacity, max_wait)
+    except Exception as e:
+        print(f"Coordination Rate Limit Error ({upstream}): {e}")
+        wait, granted = _local_buckets.reserve_token(name, rate, capacity, max_wait)
+    usage = _rate_limit_usage.get()
+    if not granted:
+        if usage is not None:
+            usage["rejected"] = True
+        raise RateLimitExceeded(f"{upstream} rate limit queue is {wait:.0f}s deep (max {max_wait:.0f}s)")
+    if wait > 0:
+        if usage is not None:
+            usage["waits"].append(wait)
+        await asyncio.sleep(wait)
+
+# --- Shared Result Cache ---
+def shared_cache(name: str, ttl: int = RESULT_CACHE_TTL):
+    """
+    Caches an async agent's result per query in the shared store. Only
+    "completed" results are cached so outages and simulated data are retried.
+
+    shallow=True is passed through to the agent and cached under its own key;
+    a full-depth result is preferred when one is cached. cache_only=True never
+    calls the agent and returns None on a miss.
+
+    observe(result, seconds) is called only when the agent actually ran (never
+    on cache hits), with its rate-limit waits subtracted from the duration. It
+    is skipped when our own limiter rejected any of the agent's requests: that
+    result says nothing about the upstream's health.
+    """
+    def decorator(fn):
+        async def lookup(key):
+            try:
+                cached = await asyncio.to_thread(get_backend().get, key)
+                return json.loads(cached) if cached else None
+            except Exception as e:
+                print(f"Coordination Cache Error ({name}): {e}")
+                return None
+
+        @functools.wraps(fn)
+        async def wrapper(query: str, shallow: bool = False, cache_only: bool = False, observe=None):
+            key = f"{KEY_PREFIX}cache:{name}:{query.strip().lower()}"
+            shallow_key = key + ":shallow"
+
+            result = await lookup(key)
+            if result is None and (shallow or cache_only):
+                result = await lookup(shallow_key)
+            if result is not None or cache_only:
+                return result
+
+            usage = {"waits": [], "rejected": False}
+            token = _rate_limit_usage.set(usage)
+            start = time.perf_counter()
+            try:
+                result = await fn(query, shallow=shallow)
+            finally:
+                _rate_limit_usage.reset(token)
+            if observe and not usage["rejected"]:
+                observe(result, max(0.0, time.perf_counter() - start - sum(usage["waits"])))
+
+            if result.get("status") == "completed":
+                try:
+                    await asyncio.to_thread(get_backend().set, shallow_key if shallow else key, json.dumps(result), ttl)
+                except Exception as e:
+                    print(f"Coordination Cache Error ({name}): {e}")
+            return result
+        return wrapper
+    return decorator
+
+# --- Shared Job State ---
+def set_job_state(job_id: str, state: dict):
+    get_backend().set(KEY_PREFIX + "job:" + job_id, json.dumps(state), JOB_STATE_TTL)
+
+def get_job_state(job_id: str):
+    value = get_backend().get(KEY_PREFIX + "job:" + job_id)
+    return json.loads(value) if value else None
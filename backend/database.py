@@ -1,4 +1,5 @@
 import os
+import json
 from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -43,6 +44,25 @@ class Report(Base):
 
     owner = relationship("User", back_populates="reports")
 
+def load_report_data(full_report_data):
+    # Reports are saved via model_dump_json(), so the JSON column usually holds a string
+    if isinstance(full_report_data, str):
+        return json.loads(full_report_data)
+    return full_report_data or {}
+
+class PortfolioStats(Base):
+    __tablename__ = "portfolio_stats"
+    # One row per user, updated incrementally as reports are inserted (see portfolio.py)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    report_count = Column(Integer, default=0)
+    score_totals = Column(JSON) # { "overall_score": 1234, "scientific_fit": ..., ... }
+    score_histogram = Column(JSON) # { "0-9": 0, "10-19": 2, ..., "90-100": 1 }
+    recommendation_counts = Column(JSON) # { "GO": 3, "NO_GO": 1, ... }
+    top_molecules = Column(JSON) # [ { "query", "job_id", "overall_score" }, ... ] best first
+    bottom_molecules = Column(JSON) # same shape, worst first
+    monthly_trend = Column(JSON) # { "2025-12": { "count": 4, "score_total": 280 } }
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # --- Create Tables ---
 # This function will create tables if they don't exist
 def create_db_tables():
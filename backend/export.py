@@ -0,0 +1,353 @@
+import os
+import io
+import csv
+import time
+import uuid
+import threading
+import textwrap
+from database import SessionLocal, Report, load_report_data
+from workers import submit_background
+from coordination import get_job_state, set_job_state
+
+# --- Report Export ---
+# Reports are streamed out of the database in batches and rendered chunk by
+# chunk, so neither a large report nor a whole portfolio is ever held in memory
+# as a finished document.
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./exports")
+EXPORT_BATCH_SIZE = 50 # Reports fetched per DB round trip
+CHUNK_SIZE = 64 * 1024 # Bytes per read when replaying a cached artifact
+EXPORT_CACHE_TTL = 24 * 3600 # Seconds; matches the bulk export job state TTL
+SWEEP_INTERVAL = 600 # Seconds between cache sweeps
+
+MEDIA_TYPES = {"pdf": "application/pdf", "csv": "text/csv"}
+
+CSV_COLUMNS = [
+    "job_id", "query", "status", "created_at", "overall_score", "scientific_fit",
+    "commercial_potential", "ip_risk", "supply_feasibility", "recommendation", "summary",
+]
+
+# --- Report Sources ---
+def iter_user_reports(user_id: int):
+    """
+    Yields (report_data, created_at) for every report of a user, oldest first.
+    Opens its own session so it can outlive the request (streaming / workers).
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(Report).filter(Report.user_id == user_id).order_by(Report.id).yield_per(EXPORT_BATCH_SIZE)
+        for r in query:
+            yield load_report_data(r.full_report_data), r.created_at
+    finally:
+        db.close()
+
+# --- CSV ---
+def iter_csv(reports):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk.encode("utf-8")
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for data, created_at in reports:
+        scores = data.get("scores", {})
+        narrative = data.get("narrative", {})
+        writer.writerow([
+            data.get("job_id", ""),
+            data.get("query", ""),
+            data.get("status", ""),
+            created_at.isoformat() if created_at else "",
+            scores.get("overall_score", ""),
+            scores.get("scientific_fit", ""),
+            scores.get("commercial_potential", ""),
+            scores.get("ip_risk", ""),
+            scores.get("supply_feasibility", ""),
+            narrative.get("recommendation", ""),
+            narrative.get("summary", ""),
+        ])
+        yield flush()
+
+# --- PDF ---
+# Minimal text-only PDF 1.4 writer using the built-in Helvetica fonts. Objects
+# are emitted as soon as each page is laid out; only the byte offsets needed
+# for the xref table are kept.
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792 # US Letter, points
+MARGIN = 50
+AVG_CHAR_WIDTH = 0.55 # Average Helvetica glyph width, in ems (slightly wide for Bold)
+
+STYLES = {
+    "title": ("F2", 16, 24),
+    "heading": ("F2", 12, 20),
+    "body": ("F1", 10, 14),
+}
+
+def _wrap_columns(size: int):
+    return int((PAGE_WIDTH - 2 * MARGIN) / (size * AVG_CHAR_WIDTH))
+
+def _pdf_escape(text: str):
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def report_lines(data: dict, created_at=None):
+    """
+    Flattens a JobResult dict into (style, text) lines for the PDF writer.
+    """
+    scores = data.get("scores", {})
+    narrative = data.get("narrative", {})
+
+    lines = [("title", f"Pharma Scout Report: {data.get('query', '')}")]
+    meta = f"Job ID: {data.get('job_id', '')}"
+    if created_at:
+        meta += f"    Generated: {created_at.strftime('%Y-%m-%d %H:%M')} UTC"
+    lines.append(("body", meta))
+
+    lines.append(("heading", "Scores"))
+    lines.append(("body", f"Overall Score: {scores.get('overall_score', 'N/A')}"))
+    lines.append(("body", f"Scientific Fit: {scores.get('scientific_fit', 'N/A')}    Commercial Potential: {scores.get('commercial_potential', 'N/A')}"))
+    lines.append(("body", f"IP Risk: {scores.get('ip_risk', 'N/A')}    Supply Feasibility: {scores.get('supply_feasibility', 'N/A')}"))
+
+    lines.append(("heading", f"Recommendation: {narrative.get('recommendation', 'N/A')}"))
+    lines.append(("body", narrative.get("summary", "")))
+
+    rationale = narrative.get("rationale", {})
+    if rationale:
+        lines.append(("heading", "Rationale"))
+        for key, value in rationale.items():
+            lines.append(("body", f"{key.capitalize()}: {value}"))
+
+    for title, key in [("Risks", "risks"), ("Next Steps", "next_steps")]:
+        items = narrative.get(key, [])
+        if items:
+            lines.append(("heading", title))
+            lines.extend(("body", f"- {item}") for item in items)
+
+    for agent in data.get("agent_details", []):
+        lines.append(("heading", f"{agent.get('agent_name', 'Agent')} ({agent.get('status', '')})"))
+        lines.append(("body", agent.get("summary", "")))
+        lines.extend(("body", f"- {finding}") for finding in agent.get("key_findings", []))
+
+    return lines
+
+def empty_portfolio_lines():
+    return [
+        ("title", "Pharma Scout Portfolio"),
+        ("body", "No reports yet. Run an evaluation to add it to your portfolio."),
+    ]
+
+def _paginate(lines):
+    """
+    Wraps lines and yields one page (list of (font, size, y, text)) at a time.
+    """
+    page = []
+    y = PAGE_HEIGHT - MARGIN
+    for style, text in lines:
+        font, size, leading = STYLES[style]
+        wrapped = textwrap.wrap(text, _wrap_columns(size)) or [""]
+        for segment in wrapped:
+            if y - leading < MARGIN and page:
+                yield page
+                page = []
+                y = PAGE_HEIGHT - MARGIN
+            y -= leading
+            page.append((font, size, y, segment))
+    if page:
+        yield page
+
+def iter_pdf(reports):
+    """
+    Streams a PDF with each report starting on a new page. An empty portfolio
+    gets a single "no reports" page, since zero-page PDFs are rejected by
+    many viewers.
+    """
+    offsets = {}
+    position = 0
+    page_ids = []
+    next_id = 5 # 1: catalog, 2: pages, 3-4: fonts
+
+    def emit(obj_id, body: bytes):
+        nonlocal position
+        offsets[obj_id] = position
+        chunk = f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position += len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield emit(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def documents():
+        empty = True
+        for data, created_at in reports:
+            empty = False
+            yield report_lines(data, created_at)
+        if empty:
+            yield empty_portfolio_lines()
+
+    for lines in documents():
+        for page in _paginate(lines):
+            content = "BT\n" + "".join(
+                f"/{font} {size} Tf 1 0 0 1 {MARGIN} {y} Tm ({_pdf_escape(text)}) Tj\n"
+                for font, size, y, text in page
+            ) + "ET"
+            stream = content.encode("latin-1")
+            content_id, page_id = next_id, next_id + 1
+            next_id += 2
+            yield emit(content_id, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+            yield emit(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode())
+            page_ids.append(page_id)
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+
+    xref_offset = position
+    xref = [f"xref\n0 {next_id}\n", "0000000000 65535 f \n"]
+    xref.extend(f"{offsets[i]:010d} 00000 n \n" for i in range(1, next_id))
+    xref.append(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+    yield "".join(xref).encode()
+
+RENDERERS = {"pdf": iter_pdf, "csv": iter_csv}
+
+# --- Artifact Cache ---
+def cache_path(key: str, fmt: str):
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.{fmt}")
+
+_last_sweep = 0.0
+
+def sweep_export_cache():
+    """
+    Deletes cached artifacts (and abandoned .tmp files) older than
+    EXPORT_CACHE_TTL. Single-report artifacts are simply re-rendered on demand.
+    """
+    if not os.path.isdir(EXPORT_CACHE_DIR):
+        return
+    cutoff = time.time() - EXPORT_CACHE_TTL
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError as e:
+            print(f"Export Cache Sweep Error ({name}): {e}")
+
+def maybe_sweep_export_cache():
+    # Throttled and run on the worker pool so it never delays a download
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep >= SWEEP_INTERVAL:
+        _last_sweep = now
+        submit_background(sweep_export_cache)
+
+def iter_file(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+def iter_cached(key: str, fmt: str, chunks):
+    """
+    Replays a cached artifact if present; otherwise streams `chunks` to the
+    client while writing them to the cache. The file only becomes visible once
+    it is complete, so an aborted download never leaves a truncated artifact.
+    """
+    path = cache_path(key, fmt)
+    if os.path.exists(path):
+        yield from iter_file(path)
+        return
+
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    maybe_sweep_export_cache()
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def iter_report_export(report: Report, fmt: str):
+    # Reports are immutable once saved, so their job_id is a stable cache key
+    data = load_report_data(report.full_report_data)
+    return iter_cached(report.job_id, fmt, RENDERERS[fmt]([(data, report.created_at)]))
+
+def iter_portfolio_export(user_id: int, fmt: str):
+    return RENDERERS[fmt](iter_user_reports(user_id))
+
+# --- Bulk Export Jobs ---
+# Bulk portfolio exports run on the shared worker pool and are written to the
+# cache directory; clients poll for status and download when completed. Job
+# state lives in the coordination backend so any worker can answer the poll.
+# With several replicas, EXPORT_CACHE_DIR must be a shared volume.
+
+def get_export_job(export_id: str):
+    return get_job_state(export_id)
+
+# Exports submitted by this process that have not finished yet, so shutdown
+# can mark them failed instead of leaving them "queued" until the state TTL
+_active_exports = set()
+_active_exports_lock = threading.Lock()
+
+def _update_export_job(export_id: str, **changes):
+    job = get_job_state(export_id)
+    if job is None:
+        raise LookupError(f"Export job state for {export_id} is missing (expired or coordination store reset)")
+    job.update(changes)
+    set_job_state(export_id, job)
+    return job
+
+def _mark_export_failed(export_id: str, error: str):
+    try:
+        _update_export_job(export_id, status="failed", error=error[:200])
+    except Exception as e:
+        # Nothing left to report to; the poll will 404 once the state is gone
+        print(f"Bulk Export State Error ({export_id}): {e}")
+
+def _run_portfolio_export(export_id: str):
+    try:
+        job = _update_export_job(export_id, status="processing")
+        for _ in iter_cached(export_id, job["format"], iter_portfolio_export(job["user_id"], job["format"])):
+            pass
+        _update_export_job(export_id, status="completed")
+    except Exception as e:
+        print(f"Bulk Export Error ({export_id}): {e}")
+        _mark_export_failed(export_id, str(e))
+    finally:
+        with _active_exports_lock:
+            _active_exports.discard(export_id)
+
+def start_portfolio_export(user_id: int, fmt: str):
+    export_id = f"portfolio-{user_id}-{uuid.uuid4().hex}"
+    set_job_state(export_id, {
+        "user_id": user_id,
+        "format": fmt,
+        "status": "queued",
+        "path": cache_path(export_id, fmt),
+        "error": None,
+    })
+    with _active_exports_lock:
+        _active_exports.add(export_id)
+    submit_background(_run_portfolio_export, export_id)
+    return export_id
+
+def fail_active_exports():
+    """
+    Called on shutdown: queued exports are cancelled and running ones are cut
+    off with the process, so report them as failed for polling clients.
+    """
+    with _active_exports_lock:
+        export_ids = list(_active_exports)
+        _active_exports.clear()
+    for export_id in export_ids:
+        _mark_export_failed(export_id, "Server shut down before the export finished. Please start a new export.")
@@ -1,12 +1,21 @@
-import google.generativeai as genai
 import os
 
 # Configure your API key here or via Environment Variable
 # For this demo, we check the environment.
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+# google.generativeai (grpc, protobuf, google-api-core) takes seconds to import,
+# so it is loaded on first use (or by the startup warm-up) instead of at import.
+_genai = None
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        if GOOGLE_API_KEY:
+            genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai
 
 def generate_narrative_with_llm(query: str, clinical_data, literature_data, market_data, ip_data):
     """
@@ -54,7 +63,7 @@ def generate_narrative_with_llm(query: str, clinical_data, literature_data, mark
     """
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash') # Updated based on available models
+        model = get_genai().GenerativeModel('gemini-2.5-flash') # Updated based on available models
         response = model.generate_content(prompt)
         # Clean the response to ensure valid JSON (remove markdown fences if any)
         text = response.text.replace("```json", "").replace("```", "").strip()
@@ -1,15 +1,23 @@
+from startup import profile_step, register_warmup, run_warmup, is_ready, profile_report # First, so imports below are timed
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
-from models import JobRequest, JobResult, ScoreCard, Narrative, AgentSummary
+from models import JobRequest, JobResult, ScoreCard, Narrative, AgentSummary, PortfolioStatsResponse
 from agents.clinical_trials import fetch_clinical_trials
 from agents.literature import fetch_literature
-from agents.search_scout import fetch_market_data, fetch_ip_data
-from llm_engine import generate_narrative_with_llm
-from database import get_db, create_db_tables, User, Report # New imports
-from auth import get_password_hash, verify_password, create_access_token, get_current_user # New imports
+from agents.search_scout import fetch_market_data, fetch_ip_data, get_search_client
+from llm_engine import generate_narrative_with_llm, get_genai, GOOGLE_API_KEY
+from admission import admission_controller
+from database import get_db, create_db_tables, engine, User, Report
+from portfolio import get_portfolio_stats, backfill_stats
+from export import MEDIA_TYPES, iter_report_export, iter_portfolio_export, iter_file, start_portfolio_export, get_export_job, fail_active_exports
+from workers import shutdown_workers
+from coordination import get_backend
+from auth import get_password_hash, verify_password, create_access_token, get_current_user, get_pwd_context
 import uuid
+import time
 import random
 import asyncio
 import json
@@ -28,6 +36,20 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+def readiness_check():
+    # Unlike /health (liveness), this only passes once background warm-up is done
+    report = profile_report()["warmup"]
+    return JSONResponse(status_code=200 if is_ready() else 503, content=report)
+
+@app.get("/startup/profile")
+def startup_profile():
+    return profile_report()
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    return admission_controller.snapshot()
+
 # --- CORS Configuration ---
 # For production, replace ["*"] with your actual frontend domain(s)
 app.add_middleware(
@@ -40,15 +62,36 @@ app.add_middleware(
 
 
 
-# --- Database Initialization (Run once on startup) ---
-@app.on_event("startup")
-def on_startup():
+# --- Database Initialization & Warm-up ---
+def init_database():
     create_db_tables()
+    with engine.connect(): # Opens the first pooled connection
+        pass
+
+# Only work no request depends on runs after the port opens; the database is
+# initialised in on_startup before uvicorn starts accepting connections.
+register_warmup("coordination backend", get_backend)
+register_warmup("portfolio stats backfill", backfill_stats)
+register_warmup("passlib/argon2", lambda: get_pwd_context().handler().get_backend())
+register_warmup("google.generativeai", get_genai)
+register_warmup("duckduckgo_search", get_search_client)
+
+@app.on_event("startup")
+async def on_startup():
+    with profile_step("init", "database"):
+        await asyncio.to_thread(init_database)
+    # Not awaited: the port opens immediately and /ready reports progress
+    app.state.warmup_task = asyncio.create_task(run_warmup())
     # Set a default SECRET_KEY if not already set (for dev convenience)
     if not os.getenv("SECRET_KEY"):
         os.environ["SECRET_KEY"] = "your-super-secret-key" # Dev default
         print("WARNING: SECRET_KEY not set. Using default. Set for production!")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_workers()
+    fail_active_exports()
+
 # --- Mock Logic for Supply Agent (Placeholder) ---
 def get_mock_supply_data(query):
     return {
@@ -97,6 +140,42 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
         "last_name": current_user.last_name
     }
 
+# --- Agent Execution (load-aware) ---
+def get_skipped_agent_data(neutral_score):
+    # Used in cache_only mode when an agent has nothing cached for this query
+    return {
+        "score": neutral_score,
+        "summary": "Skipped under high load (cache-only mode). Re-run later for live data.",
+        "findings": ["No cached result available."],
+        "status": "skipped"
+    }
+
+async def run_agent(upstream, fetch, query, admission, neutral_score):
+    """
+    Runs one agent at the depth its upstream allows: the request tier, further
+    degraded if that upstream alone is unhealthy. Outcome and latency are
+    recorded for the admission controller only when the upstream was actually
+    called, so cache hits don't hide an outage.
+    """
+    mode, reason = admission_controller.upstream_mode(upstream, admission.tier)
+    if reason and reason not in admission.reasons: # Market and IP share duckduckgo
+        admission.reasons.append(reason)
+
+    probe = False
+    if mode == "cache_only":
+        result = await fetch(query, cache_only=True)
+        if result is not None:
+            return result
+        # On a miss, an unhealthy upstream still gets its periodic live probe
+        probe = reason is not None and admission_controller.claim_probe(upstream)
+        if not probe:
+            return get_skipped_agent_data(neutral_score)
+
+    def observe(result, seconds):
+        admission_controller.record(upstream, result["status"] == "completed", seconds, probe=probe)
+
+    return await fetch(query, shallow=mode != "live", observe=observe)
+
 # --- Main Evaluation Endpoint ---
 @app.post("/evaluate", response_model=JobResult)
 async def evaluate_job(
@@ -104,13 +183,15 @@ async def evaluate_job(
     db: Session = Depends(get_db), 
     current_user: User = Depends(get_current_user) # Now requires authentication
 ):
-    query = job.query
-    
+    async with admission_controller.admit() as admission:
+        return await run_evaluation(job.query, admission, db, current_user)
+
+async def run_evaluation(query, admission, db, current_user):
     # 1. Run All Agents Concurrently
-    clinical_task = fetch_clinical_trials(query)
-    literature_task = fetch_literature(query)
-    market_task = fetch_market_data(query)
-    ip_task = fetch_ip_data(query)
+    clinical_task = run_agent("clinicaltrials", fetch_clinical_trials, query, admission, 0)
+    literature_task = run_agent("pubmed", fetch_literature, query, admission, 0)
+    market_task = run_agent("duckduckgo", fetch_market_data, query, admission, 50)
+    ip_task = run_agent("duckduckgo", fetch_ip_data, query, admission, 50)
     
     clinical_data, literature_data, market_data, ip_data = await asyncio.gather(
         clinical_task, literature_task, market_task, ip_task
@@ -119,11 +200,12 @@ async def evaluate_job(
     supply_data = get_mock_supply_data(query)
 
     # 2. Score Calculation
-    real_clinical_score = clinical_data["score"] if clinical_data["status"] != "failed" else 0
-    real_literature_score = literature_data["score"] if literature_data["status"] != "failed" else 0
+    unavailable = ("failed", "skipped")
+    real_clinical_score = clinical_data["score"] if clinical_data["status"] not in unavailable else 0
+    real_literature_score = literature_data["score"] if literature_data["status"] not in unavailable else 0
 
     scientific_fit_score = int((real_clinical_score + real_literature_score) / 2)
-    if clinical_data["status"] == "failed" and literature_data["status"] == "failed":
+    if clinical_data["status"] in unavailable and literature_data["status"] in unavailable:
         scientific_fit_score = 50
 
     comm_score = market_data["score"]
@@ -132,8 +214,12 @@ async def evaluate_job(
 
     overall = int((scientific_fit_score * 0.35) + (comm_score * 0.30) + ((100 - ip_risk) * 0.20) + (supply_score * 0.15))
 
-    # 3. LLM Narrative Generation
-    llm_output_json = generate_narrative_with_llm(query, clinical_data, literature_data, market_data, ip_data)
+    # 3. LLM Narrative Generation (skipped below the "full" tier)
+    llm_output_json = None
+    if admission.use_llm and GOOGLE_API_KEY:
+        start = time.perf_counter()
+        llm_output_json = await asyncio.to_thread(generate_narrative_with_llm, query, clinical_data, literature_data, market_data, ip_data)
+        admission_controller.record("gemini", llm_output_json is not None, time.perf_counter() - start)
     
     narrative = None
     if llm_output_json:
@@ -148,10 +234,10 @@ async def evaluate_job(
             )
         except json.JSONDecodeError as e:
             print(f"LLM JSON Decode Error: {e}")
-            narrative = get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data)
+            narrative = get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data, llm_skipped=not admission.use_llm)
     
     if not narrative: # If LLM failed or no key
-        narrative = get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data)
+        narrative = get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data, llm_skipped=not admission.use_llm)
 
 
     # Construct JobResult
@@ -170,10 +256,12 @@ async def evaluate_job(
         agent_details=[
             AgentSummary(agent_name="Clinical Trials Agent (LIVE)", status=clinical_data["status"], summary=clinical_data["summary"], key_findings=clinical_data["findings"]),
             AgentSummary(agent_name="Literature Agent (LIVE)", status=literature_data["status"], summary=literature_data["summary"], key_findings=literature_data["findings"]),
-            AgentSummary(agent_name="Market Scout (WEB SEARCH)", status="completed", summary=market_data["summary"], key_findings=market_data["findings"]),
-            AgentSummary(agent_name="IP Guardian (WEB SEARCH)", status="completed", summary=ip_data["summary"], key_findings=ip_data["findings"]),
+            AgentSummary(agent_name="Market Scout (WEB SEARCH)", status=market_data["status"], summary=market_data["summary"], key_findings=market_data["findings"]),
+            AgentSummary(agent_name="IP Guardian (WEB SEARCH)", status=ip_data["status"], summary=ip_data["summary"], key_findings=ip_data["findings"]),
             AgentSummary(agent_name="Supply Agent (MOCK)", status="completed", summary=supply_data["summary"], key_findings=supply_data["findings"]),
-        ]
+        ],
+        service_tier=admission.tier,
+        degradation_reasons=admission.reasons
     )
 
     # 4. Save Report to DB
@@ -189,8 +277,12 @@ async def evaluate_job(
 
     return job_result
 
-def get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data):
+def get_fallback_narrative(query, overall, clinical_data, market_data, ip_data, supply_data, llm_skipped=False):
     rec = "GO" if overall > 75 else "NO_GO" if overall < 40 else "NEEDS_MORE_DATA"
+    if llm_skipped:
+        llm_risk = f"LLM synthesis skipped under high load for {query}; narrative is rule-based."
+    else:
+        llm_risk = f"Insufficient LLM API Key or LLM generation failed for {query}."
     return Narrative(
         summary=f"Analysis driven by live data. Clinical status: {clinical_data['status']}. Market indicators found via web search.",
         recommendation=rec,
@@ -201,7 +293,7 @@ def get_fallback_narrative(query, overall, clinical_data, market_data, ip_data,
             "supply": supply_data["summary"]
         },
         risks=[
-            f"Insufficient LLM API Key or LLM generation failed for {query}.",
+            llm_risk,
             "Manual review of all web search findings is recommended.",
             "Potential data discrepancies between sources."
         ],
@@ -213,4 +305,71 @@ def get_fallback_narrative(query, overall, clinical_data, market_data, ip_data,
 async def read_my_reports(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     reports = db.query(Report).filter(Report.user_id == current_user.id).all()
     # Convert stored JSON strings back to JobResult Pydantic models
-    return [JobResult.model_validate_json(r.full_report_data) for r in reports]
\ No newline at end of file
+    return [JobResult.model_validate_json(r.full_report_data) for r in reports]
+
+# --- Portfolio Analytics Endpoint ---
+@app.get("/users/me/portfolio/stats", response_model=PortfolioStatsResponse)
+async def read_my_portfolio_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # Served from the pre-aggregated portfolio_stats row, not by scanning reports
+    return get_portfolio_stats(db, current_user.id)
+
+# --- Export Endpoints ---
+def check_export_format(format: str):
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format. Use 'pdf' or 'csv'.")
+    return format
+
+def attachment_headers(filename: str):
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+@app.get("/users/me/reports/{job_id}/export")
+def export_report(job_id: str, format: str = "pdf", db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    check_export_format(format)
+    report = db.query(Report).filter(Report.job_id == job_id, Report.user_id == current_user.id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return StreamingResponse(
+        iter_report_export(report, format),
+        media_type=MEDIA_TYPES[format],
+        headers=attachment_headers(f"pharma-scout-{job_id}.{format}"),
+    )
+
+@app.get("/users/me/portfolio/export")
+def export_portfolio(format: str = "csv", current_user: User = Depends(get_current_user)):
+    check_export_format(format)
+    return StreamingResponse(
+        iter_portfolio_export(current_user.id, format),
+        media_type=MEDIA_TYPES[format],
+        headers=attachment_headers(f"pharma-scout-portfolio.{format}"),
+    )
+
+@app.post("/users/me/portfolio/exports", response_model=dict)
+def create_portfolio_export(format: str = "pdf", current_user: User = Depends(get_current_user)):
+    check_export_format(format)
+    export_id = start_portfolio_export(current_user.id, format)
+    return {"export_id": export_id, "status": "queued"}
+
+def get_user_export_job(export_id: str, current_user: User):
+    job = get_export_job(export_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@app.get("/users/me/portfolio/exports/{export_id}", response_model=dict)
+def read_portfolio_export(export_id: str, current_user: User = Depends(get_current_user)):
+    job = get_user_export_job(export_id, current_user)
+    return {"export_id": export_id, "status": job["status"], "format": job["format"], "error": job["error"]}
+
+@app.get("/users/me/portfolio/exports/{export_id}/download")
+def download_portfolio_export(export_id: str, current_user: User = Depends(get_current_user)):
+    job = get_user_export_job(export_id, current_user)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if not os.path.exists(job["path"]):
+        # Expired by the cache sweep, or written on another replica / a wiped disk
+        raise HTTPException(status_code=410, detail="Export file is no longer available. Please start a new export.")
+    return StreamingResponse(
+        iter_file(job["path"]),
+        media_type=MEDIA_TYPES[job["format"]],
+        headers=attachment_headers(f"pharma-scout-portfolio.{job['format']}"),
+    )
@@ -34,3 +34,26 @@ class JobResult(BaseModel):
     scores: ScoreCard
     narrative: Narrative
     agent_details: List[AgentSummary]
+    service_tier: str = "full" # "full", "no_llm", "shallow", "cache_only" (see admission.py)
+    degradation_reasons: List[str] = []
+
+# --- Portfolio Analytics Models ---
+
+class RankedMolecule(BaseModel):
+    query: str
+    job_id: str
+    overall_score: int
+
+class TrendPoint(BaseModel):
+    month: str # "YYYY-MM"
+    count: int
+    average_score: float
+
+class PortfolioStatsResponse(BaseModel):
+    report_count: int
+    average_scores: Dict[str, float]
+    score_distribution: Dict[str, int] # { "0-9": 0, ..., "90-100": 3 }
+    recommendation_counts: Dict[str, int]
+    top_molecules: List[RankedMolecule]
+    bottom_molecules: List[RankedMolecule]
+    trend: List[TrendPoint]
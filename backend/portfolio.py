@@ -0,0 +1,175 @@
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from database import SessionLocal, Report, User, PortfolioStats, load_report_data
+
+# --- Portfolio Aggregates ---
+# PortfolioStats holds one pre-aggregated row per user. It is folded forward
+# every time a Report is flushed, so reading it never touches the reports table.
+
+SCORE_FIELDS = ["overall_score", "scientific_fit", "commercial_potential", "ip_risk", "supply_feasibility"]
+HISTOGRAM_BUCKETS = ["0-9", "10-19", "20-29", "30-39", "40-49", "50-59", "60-69", "70-79", "80-89", "90-100"]
+RANKED_MOLECULES = 5 # Size of the top/bottom lists
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING (the two we deploy on)
+INSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _bucket_for(score: int):
+    return HISTOGRAM_BUCKETS[max(0, min(9, int(score) // 10))]
+
+def _empty_stats_values(user_id: int):
+    return {
+        "user_id": user_id,
+        "report_count": 0,
+        "score_totals": {field: 0 for field in SCORE_FIELDS},
+        "score_histogram": {bucket: 0 for bucket in HISTOGRAM_BUCKETS},
+        "recommendation_counts": {},
+        "top_molecules": [],
+        "bottom_molecules": [],
+        "monthly_trend": {},
+        "updated_at": datetime.utcnow(),
+    }
+
+def _rank(entries, entry, best_first: bool):
+    # Keep one entry per molecule (its best or worst run), bounded to RANKED_MOLECULES
+    key = entry["query"].strip().lower()
+    existing = next((e for e in entries if e["query"].strip().lower() == key), None)
+    if existing:
+        better = entry["overall_score"] > existing["overall_score"]
+        if better != best_first:
+            return entries
+        entries = [e for e in entries if e is not existing]
+    entries = entries + [entry]
+    entries.sort(key=lambda e: e["overall_score"], reverse=best_first)
+    return entries[:RANKED_MOLECULES]
+
+def apply_report(stats: PortfolioStats, report_data: dict, job_id: str, created_at: datetime):
+    """
+    Folds a single report into the user's aggregates. O(1) in the number of reports.
+    Reports with agents skipped under load (cache_only tier) carry placeholder
+    scores, so they are left out of the aggregates entirely.
+    """
+    if any(agent.get("status") == "skipped" for agent in report_data.get("agent_details", [])):
+        return
+
+    scores = report_data.get("scores", {})
+    overall = scores.get("overall_score", 0)
+    recommendation = report_data.get("narrative", {}).get("recommendation", "UNKNOWN")
+    month = created_at.strftime("%Y-%m")
+
+    # JSON columns are not mutation-tracked, so always assign fresh copies
+    totals = dict(stats.score_totals or {})
+    for field in SCORE_FIELDS:
+        totals[field] = totals.get(field, 0) + scores.get(field, 0)
+
+    histogram = dict(stats.score_histogram or {})
+    bucket = _bucket_for(overall)
+    histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    recommendations = dict(stats.recommendation_counts or {})
+    recommendations[recommendation] = recommendations.get(recommendation, 0) + 1
+
+    trend = dict(stats.monthly_trend or {})
+    point = dict(trend.get(month, {"count": 0, "score_total": 0}))
+    point["count"] += 1
+    point["score_total"] += overall
+    trend[month] = point
+
+    entry = {"query": report_data.get("query", ""), "job_id": job_id, "overall_score": overall}
+
+    stats.report_count = (stats.report_count or 0) + 1
+    stats.score_totals = totals
+    stats.score_histogram = histogram
+    stats.recommendation_counts = recommendations
+    stats.monthly_trend = trend
+    stats.top_molecules = _rank(list(stats.top_molecules or []), entry, best_first=True)
+    stats.bottom_molecules = _rank(list(stats.bottom_molecules or []), entry, best_first=False)
+    stats.updated_at = datetime.utcnow()
+
+def _create_stats_row(db: Session, user_id: int):
+    """
+    Inserts an empty stats row unless one exists; True if this call created it.
+    ON CONFLICT DO NOTHING makes concurrent first inserts for a user safe: the
+    loser waits for the winner's row instead of failing on the primary key.
+    """
+    insert = INSERT_DIALECTS[db.get_bind().dialect.name]
+    stmt = insert(PortfolioStats).values(**_empty_stats_values(user_id)).on_conflict_do_nothing(index_elements=["user_id"])
+    return db.execute(stmt).rowcount == 1
+
+def _lock_stats(db: Session, user_id: int):
+    """
+    Returns the user's stats row, locked for update, creating it first if needed.
+    A freshly created row is backfilled from the reports already persisted, so
+    reports saved before the portfolio_stats table existed are counted once.
+    """
+    with db.no_autoflush:
+        created = _create_stats_row(db, user_id)
+        stats = (
+            db.query(PortfolioStats)
+            .filter(PortfolioStats.user_id == user_id)
+            .populate_existing()
+            .with_for_update()
+            .one()
+        )
+        if created:
+            reports = db.query(Report).filter(Report.user_id == user_id).order_by(Report.id).all()
+            for r in reports:
+                apply_report(stats, load_report_data(r.full_report_data), r.job_id, r.created_at or datetime.utcnow())
+    return stats
+
+def backfill_stats():
+    """
+    Creates stats rows for users who have reports but no row yet. Runs as a
+    startup warm-up step, never on the read path.
+    """
+    db = SessionLocal()
+    try:
+        user_ids = [
+            row[0] for row in db.query(User.id)
+            .filter(User.id.in_(db.query(Report.user_id)))
+            .filter(~User.id.in_(db.query(PortfolioStats.user_id)))
+        ]
+        for user_id in user_ids:
+            _lock_stats(db, user_id)
+            db.commit()
+    finally:
+        db.close()
+
+@event.listens_for(SessionLocal, "before_flush")
+def _update_stats_on_new_reports(session, flush_context, instances):
+    pending = {} # user_id -> stats row, so several reports in one flush share a row
+    for obj in list(session.new):
+        if not isinstance(obj, Report) or obj.user_id is None:
+            continue
+        if obj.created_at is None:
+            obj.created_at = datetime.utcnow()
+        if obj.user_id not in pending:
+            pending[obj.user_id] = _lock_stats(session, obj.user_id)
+        stats = pending[obj.user_id]
+        apply_report(stats, load_report_data(obj.full_report_data), obj.job_id, obj.created_at)
+
+def get_portfolio_stats(db: Session, user_id: int):
+    """
+    Returns the pre-aggregated portfolio view for a user as a plain dict.
+    Read-only: a user without a stats row yet gets an empty portfolio.
+    """
+    stats = db.query(PortfolioStats).filter(PortfolioStats.user_id == user_id).first()
+    if stats is None:
+        stats = PortfolioStats(**_empty_stats_values(user_id))
+
+    count = stats.report_count or 0
+    totals = stats.score_totals or {}
+    trend = stats.monthly_trend or {}
+    return {
+        "report_count": count,
+        "average_scores": {field: round(totals.get(field, 0) / count, 1) if count else 0.0 for field in SCORE_FIELDS},
+        "score_distribution": stats.score_histogram or {bucket: 0 for bucket in HISTOGRAM_BUCKETS},
+        "recommendation_counts": stats.recommendation_counts or {},
+        "top_molecules": stats.top_molecules or [],
+        "bottom_molecules": stats.bottom_molecules or [],
+        "trend": [
+            {"month": month, "count": point["count"], "average_score": round(point["score_total"] / point["count"], 1)}
+            for month, point in sorted(trend.items())
+        ],
+    }
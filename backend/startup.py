@@ -0,0 +1,136 @@
+import sys
+import time
+import asyncio
+import threading
+import importlib.machinery
+from contextlib import contextmanager
+
+# --- Startup Profiling & Warm-up ---
+# Imported first by main.py so every later import can be timed. Heavy SDKs are
+# loaded lazily on first use; warm-up loads them in the background after the
+# server is accepting connections, and /ready reports when it has finished.
+
+PROCESS_START = time.perf_counter()
+
+PROFILE = [] # [ { "kind": "init" | "warmup", "name", "seconds", "status" } ]
+WARMUP_STEPS = [] # [ (name, sync callable) ], run in order
+warmup_state = {"status": "pending", "started_at": None, "finished_at": None}
+
+# --- Per-module Import Timing ---
+# Same numbers as `python -X importtime`, collected in-process: each module's
+# execution is timed, and "self" excludes the modules it imported in turn.
+IMPORT_TIMES = {} # module name -> { "self": seconds, "cumulative": seconds }
+TIMED_LOADERS = (importlib.machinery.SourceFileLoader, importlib.machinery.SourcelessFileLoader, importlib.machinery.ExtensionFileLoader)
+_import_stack = threading.local()
+
+class ImportProfiler:
+    """
+    Meta path finder that never finds anything itself; it asks the remaining
+    finders for the spec and wraps exec_module on file-based loaders (which
+    are one instance per module, so patching the instance is safe).
+    """
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if isinstance(spec.loader, TIMED_LOADERS):
+                _wrap_loader(spec.loader, name)
+            return spec
+        return None
+
+def _wrap_loader(loader, name):
+    exec_module = loader.exec_module
+
+    def timed_exec_module(module):
+        stack = getattr(_import_stack, "frames", None)
+        if stack is None:
+            stack = _import_stack.frames = []
+        stack.append(0.0) # Accumulates time spent in nested imports
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            IMPORT_TIMES[name] = {"self": round(cumulative - children, 4), "cumulative": round(cumulative, 4)}
+
+    loader.exec_module = timed_exec_module
+
+_import_profiler = ImportProfiler()
+
+def install_import_profiler():
+    if _import_profiler not in sys.meta_path:
+        sys.meta_path.insert(0, _import_profiler)
+
+def uninstall_import_profiler():
+    if _import_profiler in sys.meta_path:
+        sys.meta_path.remove(_import_profiler)
+
+install_import_profiler()
+
+@contextmanager
+def profile_step(kind: str, name: str):
+    entry = {"kind": kind, "name": name, "seconds": None, "status": "running"}
+    PROFILE.append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+        entry["status"] = "ok"
+    except Exception as e:
+        entry["status"] = f"failed: {str(e)[:100]}"
+        raise
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start, 4)
+
+def register_warmup(name: str, fn):
+    WARMUP_STEPS.append((name, fn))
+
+def _since_start():
+    return round(time.perf_counter() - PROCESS_START, 4)
+
+async def run_warmup():
+    warmup_state.update(status="warming", started_at=_since_start())
+    failed = False
+    for name, fn in WARMUP_STEPS:
+        try:
+            with profile_step("warmup", name):
+                await asyncio.to_thread(fn)
+        except Exception as e:
+            # A failed step (e.g. no network for an SDK) must not take the API down
+            print(f"Warm-up Error ({name}): {e}")
+            failed = True
+    # Lazy SDK imports happened during warm-up; stop timing imports from here on
+    uninstall_import_profiler()
+    warmup_state.update(status="degraded" if failed else "ready", finished_at=_since_start())
+    print_profile()
+
+def is_ready():
+    return warmup_state["status"] in ("ready", "degraded")
+
+def profile_report(limit: int = 40):
+    modules = sorted(IMPORT_TIMES.items(), key=lambda item: item[1]["cumulative"], reverse=True)
+    packages = {}
+    for name, times in IMPORT_TIMES.items():
+        package = name.split(".")[0]
+        packages[package] = round(packages.get(package, 0) + times["self"], 4)
+    return {
+        "warmup": dict(warmup_state),
+        "total_import_seconds": round(sum(t["self"] for t in IMPORT_TIMES.values()), 4),
+        "imports_by_package": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)),
+        "imports": [{"module": name, **times} for name, times in modules[:limit]],
+        "steps": list(PROFILE),
+    }
+
+def print_profile():
+    report = profile_report(limit=15)
+    print(f"Startup profile (warm-up {warmup_state['status']} at {warmup_state['finished_at']}s after process start):")
+    print(f"  imports: {report['total_import_seconds']}s total")
+    for package, seconds in list(report["imports_by_package"].items())[:15]:
+        print(f"    {package:<36} {seconds:>8}s")
+    for entry in report["steps"]:
+        print(f"  {entry['kind']:<7} {entry['name']:<28} {entry['seconds']:>8}s  {entry['status']}")
@@ -0,0 +1,16 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Shared Background Worker Pool ---
+# Long-running work (bulk exports etc.) is submitted here instead of running
+# inside a request, so it never blocks the event loop or competes with
+# FastAPI's own threadpool for request handling.
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "4"))
+
+executor = ThreadPoolExecutor(max_workers=WORKER_POOL_SIZE, thread_name_prefix="pharma-worker")
+
+def submit_background(fn, *args, **kwargs):
+    return executor.submit(fn, *args, **kwargs)
+
+def shutdown_workers():
+    executor.shutdown(wait=False, cancel_futures=True)